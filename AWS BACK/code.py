@@ -1,8 +1,23 @@
 import json
 import os
 import datetime
+import hashlib
+import re
+import io
+import sys
+import random
+import threading
+import cProfile
+import pstats
+import zipfile
+import multiprocessing
+import concurrent.futures
+import csv
+import math
+import time
 import boto3
 import base64
+from botocore.exceptions import ClientError
 import mammoth
 from docx import Document
 from docx.shared import Pt, RGBColor
@@ -19,74 +34,298 @@ TEMPLATE_BUCKET = 'memoria-tecnica-documentos-generados-123' # Puede ser el mism
 TEMPLATE_KEY = 'plantilla/plantilla.docx' # La ruta dentro del bucket S3
 LOCAL_TEMPLATE_PATH = '/tmp/plantilla.docx' # Donde se descargará en Lambda
 
+# --- NUEVO: Varias versiones (plantilla + idioma) por petición ---
+TEMPLATE_PREFIX = 'plantilla/' # Solo se aceptan plantillas bajo este prefijo del TEMPLATE_BUCKET
+MAX_RENDITIONS = 8
+# Lambda asigna CPU en proporción a la memoria: ~1769 MB equivalen a una vCPU completa, aunque
+# os.cpu_count() informe 2 con menos memoria. Cada proceso hijo construye su propio Document.
+LAMBDA_MB_PER_VCPU = 1769
+RENDER_PARALLEL_MAX_RESOURCES = 2000 # Con estados más grandes se renderiza en este proceso (memoria)
+SUPPORTED_LOCALES = ('es', 'en')
+TRANSLATIONS = {
+    'en': {
+        'Memoria Técnica de Infraestructura AWS': 'AWS Infrastructure Technical Report',
+        'Este documento contiene un resumen detallado...': 'This document contains a detailed summary...',
+        'Características': 'Features',
+        'Servidor de Cómputo (EC2)': 'Compute Server (EC2)',
+        'Servidor EC2': 'EC2 Server',
+        'RED': 'NETWORK',
+        'ALMACENAMIENTO': 'STORAGE',
+        'Sistema Operativo': 'Operating System',
+        'Región Server': 'Server Region',
+        'Familia': 'Family',
+        'Key Pair Asociada': 'Associated Key Pair',
+        'Subred': 'Subnet',
+        'IP Privada': 'Private IP',
+        'IP Publica': 'Public IP',
+        'Desde AMI': 'From AMI',
+        'No Asignada': 'Not Assigned',
+        'ID Volumen': 'Volume ID',
+        'Ruta': 'Path',
+        'Balanceador de Carga de Aplicación (ALB)': 'Application Load Balancer (ALB)',
+        'Nombre': 'Name',
+        'Tipo': 'Type',
+        'Esquema': 'Scheme',
+        'Zonas de disponibilidad': 'Availability zones',
+        'Base de Datos Relacional (RDS)': 'Relational Database (RDS)',
+        'Motor': 'Engine',
+        'Tamaño': 'Size',
+        'Rol': 'Role',
+        'Usuario master': 'Master user',
+        'Red Privada Virtual (VPC)': 'Virtual Private Cloud (VPC)',
+        'Nombre vpc': 'VPC name',
+        'Tablas de Ruteo Asociadas': 'Associated Route Tables',
+        'Predeterminada': 'Default',
+        'Publica': 'Public',
+        'Privada': 'Private',
+        'Subredes (Subnets)': 'Subnets',
+        'Tabla de ruteo asociada': 'Associated route table',
+        'Nombre subred': 'Subnet name',
+        'N/A (Principal)': 'N/A (Main)',
+        'Sección de Ruteo': 'Routing Section',
+        'Tabla de Ruteo': 'Route Table',
+        'Nombre Tabla': 'Table name',
+        'Rutas': 'Routes',
+        'Destino': 'Destination',
+        'Gateways de Internet': 'Internet Gateways',
+        'Nombre IGW': 'IGW name',
+        'Gateways NAT': 'NAT Gateways',
+        'Nombre NATGW': 'NATGW name',
+        'Grupos de Destino (Target Groups)': 'Target Groups',
+        'Grupo de Destino': 'Target Group',
+        'Tipo de destino': 'Target type',
+        'Protocolo': 'Protocol',
+        'Puerto': 'Port',
+        'Instancias Asociadas': 'Associated Instances',
+        'No hay instancias asociadas': 'No associated instances',
+        'Servicios de Gestión de Claves (KMS)': 'Key Management Services (KMS)',
+        'Claves administradas': 'Managed keys',
+        'ID de la Clave': 'Key ID',
+        'Descripción': 'Description',
+        '{count} recursos exportados al anexo CSV "{filename}".': '{count} resources exported to the CSV appendix "{filename}".',
+        'Vista previa omitida por falta de tiempo. Descargue el documento.': 'Preview skipped due to time limits. Please download the document.',
+    },
+}
+
+# --- NUEVO: Render adaptativo según tamaño del estado y tiempo restante de la Lambda ---
+# Niveles por sección: tablas de detalle, una tabla resumida o solo anexo CSV
+RENDER_LEVELS = ('completo', 'resumen', 'anexo')
+# (sección, tipo de recurso, ms estimados por recurso a nivel completo incluyendo la vista previa)
+RENDER_SECTIONS = (
+    ('vpc', 'aws_vpc', 30),
+    ('subredes', 'aws_subnet', 3),
+    ('ruteo', 'aws_route_table', 30),
+    ('igw', 'aws_internet_gateway', 26),
+    ('nat', 'aws_nat_gateway', 18),
+    ('ec2', 'aws_instance', 160),
+    ('alb', 'aws_lb', 45),
+    ('target_groups', 'aws_lb_target_group', 28),
+    ('rds', 'aws_db_instance', 26),
+    ('kms', 'aws_kms_key', 14),
+)
+RENDER_SUMMARY_COST_MS = 4 # ms por fila en la tabla resumida
+RENDER_APPENDIX_COST_MS = 0.05 # ms por fila en el anexo CSV
+RENDER_MAX_FULL_ITEMS = 300 # Más recursos que esto en una sección => tabla resumida
+RENDER_MAX_SUMMARY_ROWS = 3000 # Más recursos que esto en una sección => anexo CSV
+RENDER_RESERVE_MS = 8000 # Tiempo máximo reservado para subir a S3, registrar el historial y responder
+API_GATEWAY_LIMIT_MS = int(os.environ.get('API_GATEWAY_LIMIT_MS', '29000')) # API Gateway corta la petición a los ~30 s sin importar el timeout de la Lambda (0 = sin tope)
+RENDER_RESERVE_FRACTION = 0.2 # Con timeouts cortos la reserva es esta fracción del tiempo restante
+
+# --- NUEVO: Índice de historial de documentos generados ---
+HISTORY_PREFIX = 'historial' # Objetos índice particionados: historial/dia=<fecha>/cuenta=<cuenta>/...
+HISTORY_DEFAULT_DAYS = 30 # Rango consultado si no se indican fechas (incluye el día 'hasta')
+HISTORY_MAX_DAYS = 366 # Máximo de días por consulta (cada día es un prefijo a listar)
+HISTORY_DEFAULT_LIMIT = 50 # Entradas por página si no se indica 'limite'
+HISTORY_MAX_LIMIT = 200
+HISTORY_S3_WORKERS = 16 # Llamadas S3 concurrentes al listar días y leer entradas
+# La ruta GET /historial debe tener un autorizador. Con JWT las cuentas permitidas vienen en este
+# claim (separadas por comas, '*' = todas); con IAM solo la cuenta de la identidad que firma.
+HISTORY_ACCOUNTS_CLAIM = 'custom:cuentas'
+HISTORY_ACCOUNT_PATTERN = re.compile(r'\d{12}|desconocida')
+DOWNLOAD_URL_EXPIRATION = 3600 # Validez de las URLs firmadas (segundos)
+
+# --- NUEVO: Empaquetado del .docx (compresión y archivos deterministas) ---
+# 'rapido' para peticiones interactivas, 'maximo' para lotes archivados
+DOCX_PACKAGING_PROFILES = {
+    'sin-compresion': {'compression': zipfile.ZIP_STORED, 'compresslevel': None},
+    'rapido': {'compression': zipfile.ZIP_DEFLATED, 'compresslevel': 1},
+    'predeterminado': {'compression': zipfile.ZIP_DEFLATED, 'compresslevel': None},
+    'maximo': {'compression': zipfile.ZIP_DEFLATED, 'compresslevel': 9},
+}
+DOCX_PACKAGING_DEFAULT = 'rapido'
+DOCX_DETERMINISTIC = True # Fechas y orden fijos en el zip: mismo contenido => mismos bytes y ETag
+ZIP_FIXED_DATE_TIME = (1980, 1, 1, 0, 0, 0) # Fecha mínima admitida por el formato zip
+
+# --- NUEVO: Perfilado bajo demanda de peticiones lentas ---
+# Se activa por muestreo o, solo si PROFILE_REQUEST_FLAGS_ENABLED, con la cabecera X-Perfilar: 1,
+# ?perfilar=1 o el campo 'perfilar' del evento (el endpoint es público: por defecto desactivado)
+PROFILE_REQUEST_FLAGS_ENABLED = os.environ.get('PERFILADO_POR_PETICION', '0') == '1'
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0')) # Fracción de peticiones perfiladas automáticamente (0 = ninguna)
+PROFILE_STACK_INTERVAL = 0.005 # Segundos entre muestras de pila para el fichero collapsed
+PROFILE_FOCUS_PATTERN = r'load_infrastructure_index|index_module_resources|render_\w+|create_\w+|prevent_table_split|save|convert_to_html'
+PROFILE_TRUTHY_VALUES = ('1', 'true', 'si', 'sí', 'yes')
+
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Headers': 'Content-Type,X-Perfilar',
+    'Access-Control-Allow-Methods': 'GET,POST,OPTIONS'
+}
+
 s3_client = boto3.client('s3')
 
 # --- LÓGICA DE LAMBDA (Reemplaza @app.route) ---
 def lambda_handler(event, context):
+    handler_started = time.monotonic()
     
     # Verificación de Bucket S3 (eliminada la condición incorrecta)
     # Puedes mantener esta verificación si quieres asegurarte que no sea el placeholder
     # if DOWNLOAD_BUCKET == '!!! REEMPLAZA-ESTO-CON-TU-BUCKET-S3-PRIVADO !!!':
     #    print("ERROR...") etc.
 
+    # --- NUEVO: Consulta del historial (GET /historial) ---
+    if is_history_request(event):
+        return handle_history_request(event)
+
+    # --- NUEVO: Versiones solicitadas (plantilla + idioma) ---
     try:
-        # --- NUEVO: Descargar la plantilla desde S3 ---
-        print(f"Descargando plantilla desde s3://{TEMPLATE_BUCKET}/{TEMPLATE_KEY} a {LOCAL_TEMPLATE_PATH}")
-        try:
-            s3_client.download_file(TEMPLATE_BUCKET, TEMPLATE_KEY, LOCAL_TEMPLATE_PATH)
-            print("Plantilla descargada exitosamente.")
-            template_path_to_use = LOCAL_TEMPLATE_PATH
-        except Exception as template_error:
-            print(f"ADVERTENCIA: No se pudo descargar la plantilla desde S3: {template_error}. Se intentará usar una local si existe, o crear documento en blanco.")
-            # Fallback a plantilla local si existe, o None si no
-            template_path_to_use = 'plantilla.docx' if os.path.exists('plantilla.docx') else None
-        # --- FIN DEL NUEVO BLOQUE ---
+        renditions = parse_renditions(event)
+        # Descargar las plantillas desde S3 (una sola vez por plantilla distinta)
+        templates = {}
+        for rendition in renditions:
+            if rendition['template_key'] not in templates:
+                templates[rendition['template_key']] = download_template(rendition['template_key'])
+    except ValueError as e:
+        return {
+            'statusCode': 400,
+            'headers': CORS_HEADERS,
+            'body': json.dumps({'error': str(e)})
+        }
 
+    try:
         # 1. Obtener el archivo .json de la solicitud
         file_content = base64.b64decode(event['body'])
+        input_hash = hashlib.sha256(file_content).hexdigest()
         input_json_path = '/tmp/estado_infraestructura.json'
         with open(input_json_path, 'wb') as f:
             f.write(file_content)
 
-        # 2. Definir nombres de archivo de salida
-        timestamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
-        output_filename = f"Memoria_Tecnica_{timestamp}.docx"
-        output_docx_path = f"/tmp/{output_filename}"
+        # Perfil de empaquetado solicitado (?empaquetado=rapido|sin-compresion|predeterminado|maximo)
+        params = event.get('queryStringParameters') or {}
+        packaging = params.get('empaquetado', DOCX_PACKAGING_DEFAULT)
+        if packaging not in DOCX_PACKAGING_PROFILES:
+            print(f"ADVERTENCIA: Perfil de empaquetado desconocido '{packaging}'. Se usará '{DOCX_PACKAGING_DEFAULT}'.")
+            packaging = DOCX_PACKAGING_DEFAULT
 
-        # 3. Reutilizar tu lógica de generación
-        # Ahora pasamos la ruta local donde se descargó (o None)
-        generate_document_from_json(input_json_path, output_docx_path, template_path_to_use) 
-        
-        # 4. Generar la vista previa de HTML
-        with open(output_docx_path, "rb") as docx_file:
-            result = mammoth.convert_to_html(docx_file)
-            html_preview = result.value
+        # 2. Definir nombres de archivo de salida (con etiqueta solo si hay varias versiones)
+        generated_at = datetime.datetime.now()
+        timestamp = generated_at.strftime("%Y%m%d-%H%M%S")
+        for rendition in renditions:
+            suffix = f"_{rendition['label']}" if len(renditions) > 1 else ''
+            rendition['output_filename'] = f"Memoria_Tecnica_{timestamp}{suffix}.docx"
 
-        # 5. Subir el .docx generado a S3
-        s3_key = f"generados/{output_filename}"
-        print(f"Subiendo documento generado a s3://{DOWNLOAD_BUCKET}/{s3_key}")
-        s3_client.upload_file(output_docx_path, DOWNLOAD_BUCKET, s3_key)
-        print("Documento subido exitosamente.")
+        # Perfilado opcional: sin perfilado no se instala ningún hook
+        profiling = start_profiling() if should_profile(event) else None
+        try:
+            # 3. Parsear e indexar el estado una sola vez para todas las versiones
+            index = load_infrastructure_index(input_json_path)
+            resumen = index['summary']
 
-        # 6. Generar una URL de descarga firmada (válida por 1 hora)
-        download_url = s3_client.generate_presigned_url(
-            'get_object',
-            Params={'Bucket': DOWNLOAD_BUCKET, 'Key': s3_key},
-            ExpiresIn=3600
-        )
+            # 3b. Planificar el nivel de cada sección según el tamaño y el tiempo restante de la Lambda
+            remaining_ms = context.get_remaining_time_in_millis() if context is not None else None
+            if API_GATEWAY_LIMIT_MS and is_api_gateway_event(event):
+                # Detrás de API Gateway el límite real es el de la API, contado desde que llegó la petición
+                gateway_ms = API_GATEWAY_LIMIT_MS - (time.monotonic() - handler_started) * 1000
+                remaining_ms = gateway_ms if remaining_ms is None else min(remaining_ms, gateway_ms)
+            deadline = time.monotonic() + (remaining_ms - render_reserve_ms(remaining_ms)) / 1000 if remaining_ms is not None else None
+            renders_per_worker = math.ceil(len(renditions) / render_worker_count(renditions, not profiling, sum(resumen['resource_counts'].values())))
+            render_plan = plan_rendering(resumen['resource_counts'], remaining_ms, renders_per_worker)
+            print(f"Plan de render: {json.dumps(render_plan)}")
+
+            # 4. Renderizar cada versión y su vista previa HTML
+            # Con perfilado se renderiza en este proceso para que el perfil lo cubra todo
+            outputs = render_renditions(index, renditions, templates, packaging, parallel=not profiling, plan=render_plan, deadline=deadline)
+        finally:
+            if profiling:
+                stop_profiling(profiling)
+
+        rendition_results = []
+        for rendition, output in zip(renditions, outputs):
+            # 5. Subir el .docx generado a S3 (y los anexos CSV junto a él)
+            s3_key = upload_generated_document(output['docx_path'], rendition['output_filename'])
+            appendix_urls = {}
+            for section_key, csv_path in output['render_report']['appendices'].items():
+                appendix_key = upload_section_appendix(csv_path, s3_key, section_key)
+                appendix_urls[section_key] = s3_client.generate_presigned_url(
+                    'get_object',
+                    Params={'Bucket': DOWNLOAD_BUCKET, 'Key': appendix_key},
+                    ExpiresIn=DOWNLOAD_URL_EXPIRATION
+                )
+
+            # 5b. Registrar la entrada en el índice de historial (no bloquea la respuesta si falla)
+            history_entry = {
+                'input_hash': input_hash,
+                'account_ids': resumen['account_ids'],
+                'vpc_ids': resumen['vpc_ids'],
+                'resource_counts': resumen['resource_counts'],
+                'template_version': templates[rendition['template_key']][1],
+                'template_key': rendition['template_key'],
+                'locale': rendition['locale'],
+                'packaging': packaging,
+                'render_levels': output['render_report']['sections'],
+                'generated_at': generated_at.isoformat(timespec='seconds'),
+                'output_key': s3_key
+            }
+            try:
+                write_history_entry(history_entry)
+            except Exception as history_error:
+                print(f"ADVERTENCIA: No se pudo registrar el documento en el historial: {history_error}")
+
+            # 6. Generar una URL de descarga firmada (válida por 1 hora)
+            download_url = s3_client.generate_presigned_url(
+                'get_object',
+                Params={
+                    'Bucket': DOWNLOAD_BUCKET,
+                    'Key': s3_key,
+                    # Conserva el nombre con fecha aunque la clave sea el hash del contenido
+                    'ResponseContentDisposition': f"attachment; filename=\"{rendition['output_filename']}\""
+                },
+                ExpiresIn=DOWNLOAD_URL_EXPIRATION
+            )
+            rendition_results.append({
+                'label': rendition['label'],
+                'locale': rendition['locale'],
+                'template_key': rendition['template_key'],
+                's3_key': s3_key,
+                'html_preview': output['html_preview'],
+                'download_url': download_url,
+                'render_levels': output['render_report']['sections'],
+                'appendix_urls': appendix_urls
+            })
+
+        # La primera versión se mantiene en los campos de siempre para el front
+        response_body = {
+            'html_preview': rendition_results[0]['html_preview'],
+            'download_url': rendition_results[0]['download_url'],
+            'render_plan': render_plan,
+            'render_levels': rendition_results[0]['render_levels'],
+            'appendix_urls': rendition_results[0]['appendix_urls']
+        }
+        if len(rendition_results) > 1:
+            response_body['renditions'] = rendition_results
+
+        # 6b. Subir los artefactos del perfilado junto al documento
+        if profiling:
+            try:
+                first_key = rendition_results[0]['s3_key']
+                response_body['profile'] = upload_profile(profiling, f"{first_key[:-len('.docx')]}_{timestamp}")
+            except Exception as profile_error:
+                print(f"ADVERTENCIA: No se pudo subir el perfil: {profile_error}")
 
         # 7. Devolver la respuesta a React
         return {
             'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*', 
-                'Access-Control-Allow-Headers': 'Content-Type',
-                'Access-Control-Allow-Methods': 'POST,OPTIONS'
-            },
-            'body': json.dumps({
-                'html_preview': html_preview,
-                'download_url': download_url
-            })
+            'headers': CORS_HEADERS,
+            'body': json.dumps(response_body)
         }
 
     except Exception as e:
@@ -98,17 +337,395 @@ def lambda_handler(event, context):
         traceback.print_exc()
         return {
             'statusCode': 500,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Headers': 'Content-Type',
-                'Access-Control-Allow-Methods': 'POST,OPTIONS'
-            },
+            'headers': CORS_HEADERS,
             'body': json.dumps({'error': f"Error interno del servidor: {str(e)}"})
         }
 
+def parse_renditions(event):
+    """Obtiene las versiones a generar: lista 'versiones' del evento o ?versiones=es,en:plantilla/otra.docx.
+
+    Cada versión es {'locale', 'template_key', 'label'}; sin indicar nada se genera la versión
+    por defecto (español con TEMPLATE_KEY). Lanza ValueError si la petición no es válida.
+    """
+    requested = event.get('versiones')
+    if requested is None:
+        raw = (event.get('queryStringParameters') or {}).get('versiones')
+        requested = []
+        for item in (raw.split(',') if raw else []):
+            locale, _, template_key = item.strip().partition(':')
+            requested.append({'locale': locale, 'template_key': template_key})
+    if not isinstance(requested, list):
+        raise ValueError("'versiones' debe ser una lista de objetos {'locale', 'template_key', 'label'}.")
+    for item in requested:
+        if not isinstance(item, dict):
+            raise ValueError(f"Versión inválida {item!r}: se esperaba un objeto {{'locale', 'template_key', 'label'}}.")
+        for field in ('locale', 'template_key', 'label'):
+            if item.get(field) is not None and not isinstance(item[field], str):
+                raise ValueError(f"El campo '{field}' de la versión {item!r} debe ser texto.")
+    if not requested:
+        requested = [{}]
+    if len(requested) > MAX_RENDITIONS:
+        raise ValueError(f"Se admiten como máximo {MAX_RENDITIONS} versiones por petición.")
+
+    renditions, labels = [], set()
+    for item in requested:
+        locale = item.get('locale') or 'es'
+        template_key = item.get('template_key') or TEMPLATE_KEY
+        if locale not in SUPPORTED_LOCALES:
+            raise ValueError(f"Idioma no soportado '{locale}'. Opciones: {', '.join(SUPPORTED_LOCALES)}.")
+        if not template_key.startswith(TEMPLATE_PREFIX) or '..' in template_key:
+            raise ValueError(f"La plantilla debe estar bajo '{TEMPLATE_PREFIX}': '{template_key}'.")
+        template_name = os.path.splitext(os.path.basename(template_key))[0]
+        label = re.sub(r'[^A-Za-z0-9_-]', '-', item.get('label') or f"{locale}_{template_name}")
+        if label in labels:
+            raise ValueError(f"Versión duplicada '{label}'.")
+        labels.add(label)
+        renditions.append({'locale': locale, 'template_key': template_key, 'label': label})
+    return renditions
+
+def download_template(template_key):
+    """Descarga una plantilla de S3 a /tmp y devuelve (ruta local o None, versión de la plantilla).
+
+    Solo la plantilla por defecto recurre a una local o a un documento en blanco si falla la descarga;
+    para cualquier otra lanza ValueError.
+    """
+    local_path = LOCAL_TEMPLATE_PATH if template_key == TEMPLATE_KEY else f"/tmp/plantilla_{hashlib.sha256(template_key.encode('utf-8')).hexdigest()[:12]}.docx"
+    print(f"Descargando plantilla desde s3://{TEMPLATE_BUCKET}/{template_key} a {local_path}")
+    try:
+        # get_object en lugar de download_file para conocer la versión de la plantilla en la misma llamada
+        template_object = s3_client.get_object(Bucket=TEMPLATE_BUCKET, Key=template_key)
+        with open(local_path, 'wb') as f:
+            f.write(template_object['Body'].read())
+        print("Plantilla descargada exitosamente.")
+        template_version = template_object.get('VersionId')
+        if not template_version or template_version == 'null': # Bucket sin versionado
+            template_version = template_object.get('ETag', '').strip('"')
+        return local_path, template_version
+    except Exception as template_error:
+        if template_key != TEMPLATE_KEY:
+            # Una plantilla pedida expresamente no se sustituye por otra: la versión no sería la solicitada
+            raise ValueError(f"No se pudo descargar la plantilla '{template_key}': {template_error}") from template_error
+        print(f"ADVERTENCIA: No se pudo descargar la plantilla desde S3: {template_error}. Se intentará usar una local si existe, o crear documento en blanco.")
+        # Fallback a plantilla local si existe, o None si no
+        template_path_to_use = 'plantilla.docx' if os.path.exists('plantilla.docx') else None
+        return template_path_to_use, 'local' if template_path_to_use else 'en-blanco'
+
+def upload_generated_document(output_docx_path, output_filename):
+    """Sube el .docx a generados/ y devuelve su clave; en modo determinista omite la subida si ya existe."""
+    if DOCX_DETERMINISTIC:
+        # Clave direccionada por contenido: si ya existe, el documento es idéntico y no se vuelve a subir
+        with open(output_docx_path, "rb") as docx_file:
+            output_hash = hashlib.sha256(docx_file.read()).hexdigest()
+        s3_key = f"generados/Memoria_Tecnica_{output_hash[:16]}.docx"
+        if s3_object_exists(DOWNLOAD_BUCKET, s3_key):
+            print(f"Documento idéntico ya existe en s3://{DOWNLOAD_BUCKET}/{s3_key}. Se omite la subida.")
+            return s3_key
+    else:
+        s3_key = f"generados/{output_filename}"
+    print(f"Subiendo documento generado a s3://{DOWNLOAD_BUCKET}/{s3_key}")
+    s3_client.upload_file(output_docx_path, DOWNLOAD_BUCKET, s3_key)
+    print("Documento subido exitosamente.")
+    return s3_key
+
+def upload_section_appendix(csv_path, docx_key, section_key):
+    """Sube un anexo CSV junto a su .docx y devuelve su clave, direccionada por el contenido del propio CSV.
+
+    El .docx solo cita el anexo por sección, así que dos estados con el mismo documento pueden tener
+    anexos distintos: la clave no puede derivarse únicamente de la del .docx.
+    """
+    with open(csv_path, "rb") as csv_file:
+        csv_hash = hashlib.sha256(csv_file.read()).hexdigest()
+    appendix_key = f"{docx_key[:-len('.docx')]}_anexo_{section_key}_{csv_hash[:16]}.csv"
+    if s3_object_exists(DOWNLOAD_BUCKET, appendix_key):
+        print(f"Anexo idéntico ya existe en s3://{DOWNLOAD_BUCKET}/{appendix_key}. Se omite la subida.")
+        return appendix_key
+    print(f"Subiendo anexo a s3://{DOWNLOAD_BUCKET}/{appendix_key}")
+    s3_client.upload_file(csv_path, DOWNLOAD_BUCKET, appendix_key)
+    return appendix_key
+
+# --- HISTORIAL DE DOCUMENTOS GENERADOS ---
+
+def is_history_request(event):
+    """Indica si el evento es una consulta GET al historial (HTTP API v2 o REST API v1)."""
+    method = event.get('requestContext', {}).get('http', {}).get('method') or event.get('httpMethod', '')
+    path = event.get('rawPath') or event.get('path') or ''
+    return method.upper() == 'GET' and path.rstrip('/').endswith('/historial')
+
+def write_history_entry(entry):
+    """Escribe un objeto índice por cuenta bajo historial/dia=<fecha>/cuenta=<cuenta>/."""
+    fecha = entry['generated_at'][:10]
+    timestamp = entry['generated_at'].replace('-', '').replace(':', '').replace('T', '-')
+    for cuenta in entry['account_ids'] or ['desconocida']:
+        # El nombre del documento distingue las versiones generadas a partir de la misma entrada
+        output_name = os.path.splitext(os.path.basename(entry['output_key']))[0]
+        index_key = f"{HISTORY_PREFIX}/dia={fecha}/cuenta={cuenta}/{timestamp}_{entry['input_hash'][:12]}_{output_name}.json"
+        print(f"Registrando historial en s3://{DOWNLOAD_BUCKET}/{index_key}")
+        s3_client.put_object(
+            Bucket=DOWNLOAD_BUCKET,
+            Key=index_key,
+            Body=json.dumps(entry).encode('utf-8'),
+            ContentType='application/json'
+        )
+
+def history_error_response(message):
+    return {
+        'statusCode': 400,
+        'headers': CORS_HEADERS,
+        'body': json.dumps({'error': message})
+    }
+
+def list_history_day(prefix):
+    """Lista las claves índice bajo el prefijo de un día (y cuenta, si se filtra)."""
+    keys = []
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=DOWNLOAD_BUCKET, Prefix=prefix):
+        keys.extend(obj['Key'] for obj in page.get('Contents', []))
+    return keys
+
+def read_history_entry(index_key):
+    return json.loads(s3_client.get_object(Bucket=DOWNLOAD_BUCKET, Key=index_key)['Body'].read())
+
+def history_allowed_accounts(event):
+    """Cuentas cuyo historial puede consultar quien llama, según el autorizador de la ruta (None si no hay)."""
+    authorizer = event.get('requestContext', {}).get('authorizer') or {}
+    claims = (authorizer.get('jwt') or {}).get('claims') or {}
+    if HISTORY_ACCOUNTS_CLAIM in claims:
+        # La HTTP API entrega los claims de tipo lista como texto ("[a b]"), por eso se separa a mano
+        raw = claims[HISTORY_ACCOUNTS_CLAIM]
+        raw = ' '.join(raw) if isinstance(raw, list) else str(raw)
+        return {account for account in re.split(r'[,\s\[\]]+', raw) if account}
+    iam_account = (authorizer.get('iam') or {}).get('accountId')
+    if iam_account:
+        return {iam_account}
+    return None
+
+def handle_history_request(event):
+    """Devuelve una página de entradas del historial filtradas por cuenta y/o rango de fechas, con URLs firmadas.
+
+    Solo devuelve cuentas autorizadas para quien llama (ver history_allowed_accounts).
+    Parámetros de consulta: cuenta (opcional), desde y hasta (YYYY-MM-DD, opcionales), limite y
+    continuacion (el 'next_token' de la página anterior). Solo se listan los prefijos de los días del
+    rango, nunca todo generados/; los días se listan y las entradas de la página se leen en paralelo.
+    """
+    allowed_accounts = history_allowed_accounts(event)
+    if allowed_accounts is None:
+        return {
+            'statusCode': 401,
+            'headers': CORS_HEADERS,
+            'body': json.dumps({'error': "La consulta del historial requiere un autorizador (JWT o IAM) en la ruta."})
+        }
+    params = event.get('queryStringParameters') or {}
+    cuenta = params.get('cuenta')
+    continuacion = params.get('continuacion')
+    if cuenta and not HISTORY_ACCOUNT_PATTERN.fullmatch(cuenta):
+        return history_error_response(f"Cuenta inválida '{cuenta}'.")
+    if cuenta and '*' not in allowed_accounts and cuenta not in allowed_accounts:
+        return {
+            'statusCode': 403,
+            'headers': CORS_HEADERS,
+            'body': json.dumps({'error': f"No tiene acceso al historial de la cuenta '{cuenta}'."})
+        }
+    # Sin 'cuenta' se consultan solo las cuentas permitidas; todas únicamente con '*'
+    if cuenta:
+        accounts = [cuenta]
+    elif '*' in allowed_accounts:
+        accounts = [None]
+    else:
+        accounts = sorted(allowed_accounts)
+    try:
+        hasta = datetime.date.fromisoformat(params['hasta']) if params.get('hasta') else datetime.datetime.now().date()
+        desde = datetime.date.fromisoformat(params['desde']) if params.get('desde') else hasta - datetime.timedelta(days=HISTORY_DEFAULT_DAYS - 1)
+    except ValueError:
+        return history_error_response("Fechas inválidas: use el formato YYYY-MM-DD en 'desde' y 'hasta'.")
+    num_days = (hasta - desde).days + 1
+    if num_days < 1 or num_days > HISTORY_MAX_DAYS:
+        return history_error_response(f"Rango de fechas inválido: debe cubrir entre 1 y {HISTORY_MAX_DAYS} días.")
+    try:
+        limite = int(params.get('limite', HISTORY_DEFAULT_LIMIT))
+    except ValueError:
+        limite = 0
+    if not 1 <= limite <= HISTORY_MAX_LIMIT:
+        return history_error_response(f"'limite' debe ser un entero entre 1 y {HISTORY_MAX_LIMIT}.")
+    if continuacion and not continuacion.startswith(f"{HISTORY_PREFIX}/dia="):
+        return history_error_response("Token de continuación inválido.")
+
+    try:
+        prefixes = []
+        for offset in range(num_days):
+            prefix = f"{HISTORY_PREFIX}/dia={(desde + datetime.timedelta(days=offset)).isoformat()}/"
+            prefixes.extend(prefix + f"cuenta={account}/" if account else prefix for account in accounts)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=HISTORY_S3_WORKERS) as executor:
+            index_keys = [key for keys in executor.map(list_history_day, prefixes) for key in keys]
+
+            # Un documento multi-cuenta tiene un índice por cuenta con el mismo nombre de objeto
+            # (fecha y hora, hash de entrada y documento): se deduplica por nombre antes de paginar
+            # para que 'limite' cuente documentos y una generación no aparezca en dos páginas
+            index_keys = list({os.path.basename(key): key for key in sorted(index_keys, reverse=True)}.values())
+
+            # Más recientes primero: el nombre del objeto empieza por la fecha y hora de generación
+            index_keys.sort(key=os.path.basename, reverse=True)
+            if continuacion:
+                index_keys = [key for key in index_keys if os.path.basename(key) < os.path.basename(continuacion)]
+            page_keys = index_keys[:limite]
+            next_token = page_keys[-1] if len(index_keys) > limite else None
+
+            page_entries = list(executor.map(read_history_entry, page_keys))
+
+        entries = {}
+        for entry in page_entries:
+            # Salvaguarda por generación (los índices ya vienen deduplicados por nombre).
+            # output_key no basta: generaciones del mismo contenido comparten la clave direccionada por hash
+            entries[(entry['generated_at'], entry['input_hash'], entry['output_key'])] = entry
+
+        for entry in entries.values():
+            entry['download_url'] = s3_client.generate_presigned_url(
+                'get_object',
+                Params={'Bucket': DOWNLOAD_BUCKET, 'Key': entry['output_key']},
+                ExpiresIn=DOWNLOAD_URL_EXPIRATION
+            )
+
+        return {
+            'statusCode': 200,
+            'headers': CORS_HEADERS,
+            'body': json.dumps({
+                'desde': desde.isoformat(),
+                'hasta': hasta.isoformat(),
+                'entries': sorted(entries.values(), key=lambda e: e['generated_at'], reverse=True),
+                'next_token': next_token
+            })
+        }
+    except Exception as e:
+        print(f"Error al consultar el historial: {e}")
+        import traceback
+        traceback.print_exc()
+        return {
+            'statusCode': 500,
+            'headers': CORS_HEADERS,
+            'body': json.dumps({'error': f"Error interno del servidor: {str(e)}"})
+        }
+
+# --- PERFILADO BAJO DEMANDA ---
+
+class StackSampler:
+    """Muestrea la pila de un hilo a intervalos fijos y acumula pilas en formato collapsed (flamegraph)."""
+
+    def __init__(self, thread_id, interval=PROFILE_STACK_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = {}
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                key = ';'.join(reversed(stack))
+                self.counts[key] = self.counts.get(key, 0) + 1
+
+    def collapsed(self):
+        return ''.join(f"{stack} {count}\n" for stack, count in sorted(self.counts.items()))
+
+def should_profile(event):
+    """Decide si perfilar la petición: por muestreo o, si está habilitado, por cabecera/parámetro/campo del evento."""
+    if not PROFILE_REQUEST_FLAGS_ENABLED:
+        return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+    headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+    params = event.get('queryStringParameters') or {}
+    for flag in (headers.get('x-perfilar'), params.get('perfilar'), event.get('perfilar')):
+        if flag is True or str(flag).lower() in PROFILE_TRUTHY_VALUES:
+            return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+def start_profiling():
+    """Arranca cProfile (tiempos por función) y el muestreador de pilas sobre el hilo actual."""
+    print("Perfilado activado para esta petición.")
+    sampler = StackSampler(threading.get_ident())
+    profiler = cProfile.Profile()
+    sampler.start()
+    profiler.enable()
+    return {'profiler': profiler, 'sampler': sampler}
+
+def stop_profiling(profiling):
+    profiling['profiler'].disable()
+    profiling['sampler'].stop()
+    # Resumen en CloudWatch de las funciones de interés
+    stats = pstats.Stats(profiling['profiler'], stream=sys.stdout)
+    stats.sort_stats('cumulative').print_stats(PROFILE_FOCUS_PATTERN)
+
+def upload_profile(profiling, base_key):
+    """Sube el .pstats y el .collapsed.txt a S3 junto al documento y devuelve sus claves y URLs firmadas."""
+    pstats_path = '/tmp/perfil.pstats'
+    collapsed_path = '/tmp/perfil.collapsed.txt'
+    profiling['profiler'].dump_stats(pstats_path)
+    with open(collapsed_path, 'w', encoding='utf-8') as f:
+        f.write(profiling['sampler'].collapsed())
+    result = {}
+    for name, local_path, key in (('pstats', pstats_path, f"{base_key}.perfil.pstats"),
+                                  ('collapsed', collapsed_path, f"{base_key}.perfil.collapsed.txt")):
+        print(f"Subiendo perfil a s3://{DOWNLOAD_BUCKET}/{key}")
+        s3_client.upload_file(local_path, DOWNLOAD_BUCKET, key)
+        result[f"{name}_key"] = key
+        result[f"{name}_url"] = s3_client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': DOWNLOAD_BUCKET, 'Key': key},
+            ExpiresIn=DOWNLOAD_URL_EXPIRATION
+        )
+    return result
+
 # --- FUNCIONES DE AYUDA Y CREACIÓN DE TABLAS ---
 
-# ... (El código de todas tus funciones de ayuda como prevent_table_split, find_resources_in_module, etc., sigue aquí SIN CAMBIOS) ...
+def s3_object_exists(bucket, key):
+    """Comprueba con head_object si la clave ya existe en el bucket."""
+    try:
+        s3_client.head_object(Bucket=bucket, Key=key)
+        return True
+    except Exception as e:
+        # Sin s3:ListBucket un objeto inexistente devuelve 403 en lugar de 404; ante cualquier error
+        # se considera ausente y se sube igualmente: la deduplicación nunca debe hacer fallar la petición
+        code = e.response.get('Error', {}).get('Code') if isinstance(e, ClientError) else None
+        if code not in ('404', 'NoSuchKey', 'NotFound'):
+            print(f"ADVERTENCIA: No se pudo comprobar si existe s3://{bucket}/{key} ({e}). Se subirá el documento.")
+        return False
+
+def save_docx(document, output_docx_path, packaging=DOCX_PACKAGING_DEFAULT, deterministic=DOCX_DETERMINISTIC):
+    """Guarda el documento reempaquetando el zip con el perfil de compresión indicado.
+
+    En modo determinista las entradas se escriben en orden fijo ([Content_Types].xml primero)
+    y con fecha fija, de modo que el mismo contenido produce exactamente los mismos bytes.
+    """
+    if packaging == 'predeterminado' and not deterministic:
+        document.save(output_docx_path)
+        return
+    profile = DOCX_PACKAGING_PROFILES[packaging]
+    buffer = io.BytesIO()
+    document.save(buffer)
+    buffer.seek(0)
+    with zipfile.ZipFile(buffer) as source, zipfile.ZipFile(output_docx_path, 'w') as target:
+        names = source.namelist()
+        if deterministic:
+            names = sorted(names, key=lambda name: (name != '[Content_Types].xml', name))
+        for name in names:
+            original = source.getinfo(name)
+            entry = zipfile.ZipInfo(name, date_time=ZIP_FIXED_DATE_TIME if deterministic else original.date_time)
+            entry.compress_type = profile['compression']
+            entry.external_attr = 0o644 << 16 if deterministic else original.external_attr
+            target.writestr(entry, source.read(name), compresslevel=profile['compresslevel'])
+
+# ... (El código de todas tus funciones de ayuda como prevent_table_split, index_module_resources, etc., sigue aquí SIN CAMBIOS) ...
 def prevent_table_split(table):
     """Aplica propiedades a una tabla para evitar cortes extraños entre páginas."""
     for row in table.rows:
@@ -118,51 +735,70 @@ def prevent_table_split(table):
         trPr = row._tr.get_or_add_trPr()
         trPr.keepNext = True
 
-def find_resources_in_module(module, resource_type):
-    """Busca recursivamente recursos de un tipo específico en un módulo y sus submódulos."""
-    found_resources = []
-    if 'resources' in module:
-        for resource in module['resources']:
-            if resource.get('type') == resource_type:
-                found_resources.append(resource)
-    if 'child_modules' in module:
-        for child_module in module['child_modules']:
-            found_resources.extend(find_resources_in_module(child_module, resource_type))
-    return found_resources
-
-def create_ec2_table(document, ec2_instance):
+ARN_ACCOUNT_PATTERN = re.compile(r'^arn:aws[\w-]*:[\w-]+:[\w-]*:(\d{12}):')
+
+def index_module_resources(module, resources, summary):
+    """Recorre recursivamente el módulo y sus submódulos una sola vez.
+
+    Agrupa los recursos por tipo en `resources` y acumula en `summary` el conteo por tipo,
+    los IDs de VPC y las cuentas (owner_id / ARNs) para el historial. Las cuentas solo se toman de
+    recursos gestionados: un data source (p. ej. una AMI de Amazon) trae el owner_id del proveedor.
+    """
+    for resource in module.get('resources', []):
+        resource_type = resource.get('type', 'desconocido')
+        resources.setdefault(resource_type, []).append(resource)
+        summary['resource_counts'][resource_type] = summary['resource_counts'].get(resource_type, 0) + 1
+        values = resource.get('values') or {}
+        if resource_type == 'aws_vpc' and values.get('id') and values['id'] not in summary['vpc_ids']:
+            summary['vpc_ids'].append(values['id'])
+        if resource.get('mode', 'managed') != 'managed':
+            continue
+        account_id = values.get('owner_id') or values.get('account_id')
+        if not account_id:
+            match = ARN_ACCOUNT_PATTERN.match(values.get('arn') or '')
+            account_id = match.group(1) if match else None
+        if account_id and account_id not in summary['account_ids']:
+            summary['account_ids'].append(account_id)
+    for child_module in module.get('child_modules', []):
+        index_module_resources(child_module, resources, summary)
+
+def tr(text, locale):
+    """Traduce una etiqueta del documento; el español es el idioma base y no necesita traducción."""
+    return TRANSLATIONS.get(locale, {}).get(text, text)
+
+def create_ec2_table(document, ec2_instance, locale='es'):
     values = ec2_instance.get('values', {})
     tags = values.get('tags', {})
     root_block_device = values.get('root_block_device', [{}])[0]
-    heading = document.add_heading('Servidor de Cómputo (EC2)', level=1)
+    heading = document.add_heading(tr('Servidor de Cómputo (EC2)', locale), level=1)
     heading.paragraph_format.keep_with_next = True
     table = document.add_table(rows=13, cols=6)
     table.style = 'Table Grid'
-    table.cell(0, 0).merge(table.cell(6, 0)).text = tags.get('Name', 'Servidor EC2')
+    table.cell(0, 0).merge(table.cell(6, 0)).text = tags.get('Name', tr('Servidor EC2', locale))
     table.cell(0, 0).paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
     table.cell(0, 0).vertical_alignment = WD_ALIGN_VERTICAL.CENTER
-    table.cell(7, 0).merge(table.cell(9, 0)).text = 'RED'
+    table.cell(7, 0).merge(table.cell(9, 0)).text = tr('RED', locale)
     table.cell(7, 0).paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
     table.cell(7, 0).vertical_alignment = WD_ALIGN_VERTICAL.CENTER
-    table.cell(10, 0).merge(table.cell(10, 5)).text = 'ALMACENAMIENTO'
+    table.cell(10, 0).merge(table.cell(10, 5)).text = tr('ALMACENAMIENTO', locale)
     table.cell(10, 0).paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
     cell_header = table.cell(0, 1)
     cell_header.merge(table.cell(0, 5))
-    cell_header.text = 'Características'
+    cell_header.text = tr('Características', locale)
     cell_header.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
     shading_elm = parse_xml(r'<w:shd {} w:fill="00A9ED"/>'.format(nsdecls('w')))
     cell_header._tc.get_or_add_tcPr().append(shading_elm)
-    fields = ["Instance ID", "Server Name", "Sistema Operativo", "Región Server", "Familia", "Key Pair Asociada", "Subred", "IP Privada", "IP Publica"]
+    fields = [tr(field, locale) for field in ["Instance ID", "Server Name", "Sistema Operativo", "Región Server", "Familia", "Key Pair Asociada", "Subred", "IP Privada", "IP Publica"]]
     field_values = [
         values.get('id', 'N/A'),
         tags.get('Name', 'N/A'),
-        f"Desde AMI: {values.get('ami', 'N/A')}",
+        f"{tr('Desde AMI', locale)}: {values.get('ami', 'N/A')}",
         values.get('availability_zone', 'N/A').rsplit('-', 1)[0],
         values.get('instance_type', 'N/A'),
         values.get('key_name', 'N/A'),
         values.get('subnet_id', 'N/A'),
         values.get('private_ip', 'N/A'),
-        values.get('public_ip', 'N/A') or 'No Asignada'
+        values.get('public_ip', 'N/A') or tr('No Asignada', locale)
     ]
     for i, field in enumerate(fields):
         row_index = i + 1
@@ -170,7 +806,7 @@ def create_ec2_table(document, ec2_instance):
         value_cell = table.cell(row_index, 2)
         value_cell.merge(table.cell(row_index, 5))
         value_cell.text = field_values[i]
-    storage_headers = ["ID Volumen", "Ruta", "Size (GB)", "Type", "IOPS", "Throughput"]
+    storage_headers = [tr(header, locale) for header in ["ID Volumen", "Ruta", "Size (GB)", "Type", "IOPS", "Throughput"]]
     for i, header in enumerate(storage_headers):
         table.cell(11, i).text = header
     storage_values = [
@@ -186,9 +822,9 @@ def create_ec2_table(document, ec2_instance):
     prevent_table_split(table)
     document.add_paragraph('\n')
 
-def create_alb_table(document, alb, listeners, attachments, subnets_map):
+def create_alb_table(document, alb, listeners, attachments, subnets_map, locale='es'):
     alb_values = alb.get('values', {})
-    heading = document.add_heading('Balanceador de Carga de Aplicación (ALB)', level=1)
+    heading = document.add_heading(tr('Balanceador de Carga de Aplicación (ALB)', locale), level=1)
     heading.paragraph_format.keep_with_next = True
     esquema = "Internal" if alb_values.get('internal') else "Internet-facing"
     availability_zones = []
@@ -198,11 +834,11 @@ def create_alb_table(document, alb, listeners, attachments, subnets_map):
             az_id = subnets_map.get(subnet_id, {}).get('values', {}).get('availability_zone_id', 'N/A')
             availability_zones.append(f"{az} ({az_id})")
     caracteristicas_data = {
-        "Nombre": alb_values.get('name', 'N/A'),
-        "Tipo": alb_values.get('load_balancer_type', 'N/A').capitalize(),
-        "Esquema": esquema,
+        tr("Nombre", locale): alb_values.get('name', 'N/A'),
+        tr("Tipo", locale): alb_values.get('load_balancer_type', 'N/A').capitalize(),
+        tr("Esquema", locale): esquema,
         "VPC": alb_values.get('vpc_id', 'N/A'),
-        "Zonas de disponibilidad": "\n".join(availability_zones),
+        tr("Zonas de disponibilidad", locale): "\n".join(availability_zones),
         "DNS name": alb_values.get('dns_name', 'N/A')
     }
     table = document.add_table(rows=1, cols=4)
@@ -210,7 +846,7 @@ def create_alb_table(document, alb, listeners, attachments, subnets_map):
     hdr_cells_caract = table.rows[0].cells
     cell_header_caract = hdr_cells_caract[1]
     cell_header_caract.merge(hdr_cells_caract[3])
-    cell_header_caract.text = 'Características'
+    cell_header_caract.text = tr('Características', locale)
     cell_header_caract.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
     shading_caract = parse_xml(r'<w:shd {} w:fill="00A9ED"/>'.format(nsdecls('w')))
     cell_header_caract._tc.get_or_add_tcPr().append(shading_caract)
@@ -253,9 +889,9 @@ def create_alb_table(document, alb, listeners, attachments, subnets_map):
     prevent_table_split(table)
     document.add_paragraph('\n')
 
-def create_rds_table(document, rds_instance):
+def create_rds_table(document, rds_instance, locale='es'):
     values = rds_instance.get('values', {})
-    heading = document.add_heading('Base de Datos Relacional (RDS)', level=1)
+    heading = document.add_heading(tr('Base de Datos Relacional (RDS)', locale), level=1)
     heading.paragraph_format.keep_with_next = True
     table = document.add_table(rows=8, cols=3)
     table.style = 'Table Grid'
@@ -267,18 +903,18 @@ def create_rds_table(document, rds_instance):
     cell_icon.vertical_alignment = WD_ALIGN_VERTICAL.CENTER
     cell_header = table.cell(0, 1)
     cell_header.merge(table.cell(0, 2))
-    cell_header.text = 'Características'
+    cell_header.text = tr('Características', locale)
     cell_header.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
     shading_elm = parse_xml(r'<w:shd {} w:fill="00A9ED"/>'.format(nsdecls('w')))
     cell_header._tc.get_or_add_tcPr().append(shading_elm)
     fields = {
         "DB Identifier": values.get('identifier', 'N/A'),
-        "Motor": f"{values.get('engine', 'N/A')} {values.get('engine_version', '')}",
-        "Tamaño": values.get('instance_class', 'N/A'),
-        "Rol": "Writer Instance" if not values.get('replicate_source_db') else "Replica Instance",
-        "Región Server": values.get('availability_zone', 'N/A').rsplit('-', 1)[0],
+        tr("Motor", locale): f"{values.get('engine', 'N/A')} {values.get('engine_version', '')}",
+        tr("Tamaño", locale): values.get('instance_class', 'N/A'),
+        tr("Rol", locale): "Writer Instance" if not values.get('replicate_source_db') else "Replica Instance",
+        tr("Región Server", locale): values.get('availability_zone', 'N/A').rsplit('-', 1)[0],
         "Endpoint": values.get('endpoint', 'N/A'),
-        "Usuario master": values.get('username', 'N/A')
+        tr("Usuario master", locale): values.get('username', 'N/A')
     }
     row_index = 1
     for key, value in fields.items():
@@ -288,10 +924,10 @@ def create_rds_table(document, rds_instance):
     prevent_table_split(table)
     document.add_paragraph('\n')
 
-def create_vpc_table(document, vpc, route_tables_info):
+def create_vpc_table(document, vpc, route_tables_info, locale='es'):
     vpc_values = vpc.get('values', {})
     vpc_tags = vpc_values.get('tags', {})
-    heading = document.add_heading('Red Privada Virtual (VPC)', level=1)
+    heading = document.add_heading(tr('Red Privada Virtual (VPC)', locale), level=1)
     heading.paragraph_format.keep_with_next = True
     table = document.add_table(rows=9, cols=3)
     table.style = 'Table Grid'
@@ -302,13 +938,13 @@ def create_vpc_table(document, vpc, route_tables_info):
     cell_icon.vertical_alignment = WD_ALIGN_VERTICAL.CENTER
     cell_header_caract = table.cell(0, 1)
     cell_header_caract.merge(table.cell(0, 2))
-    cell_header_caract.text = 'Características'
+    cell_header_caract.text = tr('Características', locale)
     cell_header_caract.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
     shading_caract = parse_xml(r'<w:shd {} w:fill="00A9ED"/>'.format(nsdecls('w')))
     cell_header_caract._tc.get_or_add_tcPr().append(shading_caract)
     caracteristicas_vpc = {
         "VPC ID": vpc_values.get('id', 'N/A'),
-        "Nombre vpc": vpc_tags.get('Name', 'N/A'),
+        tr("Nombre vpc", locale): vpc_tags.get('Name', 'N/A'),
         "CIDR IPv4": vpc_values.get('cidr_block', 'N/A')
     }
     row_index = 1
@@ -318,12 +954,12 @@ def create_vpc_table(document, vpc, route_tables_info):
         row_index += 1
     cell_header_rt = table.cell(4, 1)
     cell_header_rt.merge(table.cell(4, 2))
-    cell_header_rt.text = 'Tablas de Ruteo Asociadas'
+    cell_header_rt.text = tr('Tablas de Ruteo Asociadas', locale)
     cell_header_rt.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
     rt_map_local = { # Renombrado para evitar conflicto con rt_map global
-        "Predeterminada": route_tables_info.get("Default", "N/A"),
-        "Publica": route_tables_info.get("Public", "N/A"),
-        "Privada": route_tables_info.get("Private", "N/A"),
+        tr("Predeterminada", locale): route_tables_info.get("Default", "N/A"),
+        tr("Publica", locale): route_tables_info.get("Public", "N/A"),
+        tr("Privada", locale): route_tables_info.get("Private", "N/A"),
         "RDS": route_tables_info.get("RDS", "N/A")
     }
     row_index = 5
@@ -334,19 +970,19 @@ def create_vpc_table(document, vpc, route_tables_info):
     prevent_table_split(table)
     document.add_paragraph('\n')
 
-def create_all_subnets_table(document, all_subnets, associations_map, rt_map):
+def create_all_subnets_table(document, all_subnets, associations_map, rt_map, locale='es'):
     if not all_subnets: return
-    heading = document.add_heading('Subredes (Subnets)', level=1)
+    heading = document.add_heading(tr('Subredes (Subnets)', locale), level=1)
     heading.paragraph_format.keep_with_next = True
     table = document.add_table(rows=2, cols=5)
     table.style = 'Table Grid'
     cell_header = table.cell(0, 0)
     cell_header.merge(table.cell(0, 4))
-    cell_header.text = 'Características'
+    cell_header.text = tr('Características', locale)
     cell_header.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
     shading_elm = parse_xml(r'<w:shd {} w:fill="00A9ED"/>'.format(nsdecls('w')))
     cell_header._tc.get_or_add_tcPr().append(shading_elm)
-    column_headers = ["VPC ID", "Tabla de ruteo asociada", "Nombre subred", "CIDR", "AZ"]
+    column_headers = [tr(header, locale) for header in ["VPC ID", "Tabla de ruteo asociada", "Nombre subred", "CIDR", "AZ"]]
     for i, text in enumerate(column_headers):
         table.cell(1, i).text = text
         table.cell(1, i).paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
@@ -356,7 +992,7 @@ def create_all_subnets_table(document, all_subnets, associations_map, rt_map):
         tags = values.get('tags', {})
         subnet_id = values.get('id', 'N/A')
         rt_id = associations_map.get(subnet_id, None)
-        route_table_name = rt_map.get(rt_id, "N/A (Principal)")
+        route_table_name = rt_map.get(rt_id, tr("N/A (Principal)", locale))
         row_cells[0].text = values.get('vpc_id', 'N/A')
         row_cells[1].text = route_table_name
         row_cells[2].text = tags.get('Name', 'N/A')
@@ -374,29 +1010,29 @@ def create_all_subnets_table(document, all_subnets, associations_map, rt_map):
     prevent_table_split(table)
     document.add_paragraph('\n')
 
-def create_route_table_section(document, route_table, igw_map, nat_map):
+def create_route_table_section(document, route_table, igw_map, nat_map, locale='es'):
     rt_values = route_table.get('values', {})
     rt_tags = rt_values.get('tags', {})
     rt_name = rt_tags.get('Name', 'N/A')
-    heading = document.add_heading(f'Tabla de Ruteo: {rt_name}', level=2)
+    heading = document.add_heading(f"{tr('Tabla de Ruteo', locale)}: {rt_name}", level=2)
     heading.paragraph_format.keep_with_next = True
     table = document.add_table(rows=5, cols=3)
     table.style = 'Table Grid'
     cell_header_caract = table.cell(0, 1)
     cell_header_caract.merge(table.cell(0, 2))
-    cell_header_caract.text = 'Características'
+    cell_header_caract.text = tr('Características', locale)
     cell_header_caract.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
     shading_caract = parse_xml(r'<w:shd {} w:fill="00A9ED"/>'.format(nsdecls('w')))
     cell_header_caract._tc.get_or_add_tcPr().append(shading_caract)
     table.cell(1, 1).text = "VPC ID"
     table.cell(1, 2).text = rt_values.get('vpc_id', 'N/A')
-    table.cell(2, 1).text = "Nombre Tabla"
+    table.cell(2, 1).text = tr("Nombre Tabla", locale)
     table.cell(2, 2).text = rt_name
     cell_header_routes = table.cell(3, 1)
     cell_header_routes.merge(table.cell(3, 2))
-    cell_header_routes.text = 'Rutas'
+    cell_header_routes.text = tr('Rutas', locale)
     cell_header_routes.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
-    table.cell(4, 1).text = "Destino"
+    table.cell(4, 1).text = tr("Destino", locale)
     table.cell(4, 2).text = "Target"
     routes = rt_values.get('route', [])
     for route in routes:
@@ -417,13 +1053,13 @@ def create_route_table_section(document, route_table, igw_map, nat_map):
         row_cells[2].text = target
     cell_icon = table.cell(0, 0)
     cell_icon.merge(table.cell(len(table.rows) - 1, 0))
-    cell_icon.text = "Rutas"
+    cell_icon.text = tr("Rutas", locale)
     cell_icon.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
     cell_icon.vertical_alignment = WD_ALIGN_VERTICAL.CENTER
     prevent_table_split(table)
     document.add_paragraph('\n')
 
-def create_igw_section(document, igw):
+def create_igw_section(document, igw, locale='es'):
     igw_values = igw.get('values', {})
     igw_tags = igw_values.get('tags', {})
     igw_name = igw_tags.get('Name', 'N/A')
@@ -438,20 +1074,20 @@ def create_igw_section(document, igw):
     cell_icon.vertical_alignment = WD_ALIGN_VERTICAL.CENTER
     cell_header_caract = table.cell(0, 1)
     cell_header_caract.merge(table.cell(0, 2))
-    cell_header_caract.text = 'Características'
+    cell_header_caract.text = tr('Características', locale)
     cell_header_caract.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
     shading_caract = parse_xml(r'<w:shd {} w:fill="00A9ED"/>'.format(nsdecls('w')))
     cell_header_caract._tc.get_or_add_tcPr().append(shading_caract)
     table.cell(1, 1).text = "VPC ID"
     table.cell(1, 2).text = igw_values.get('vpc_id', 'N/A')
-    table.cell(2, 1).text = "Nombre IGW"
+    table.cell(2, 1).text = tr("Nombre IGW", locale)
     table.cell(2, 2).text = igw_name
     table.cell(3, 1).text = "IGW ID"
     table.cell(3, 2).text = igw_values.get('id', 'N/A')
     prevent_table_split(table)
     document.add_paragraph('\n')
 
-def create_nat_gateway_table(document, nat_gateway, subnets_map):
+def create_nat_gateway_table(document, nat_gateway, subnets_map, locale='es'):
     nat_values = nat_gateway.get('values', {})
     nat_tags = nat_values.get('tags', {})
     heading = document.add_heading(f"NAT Gateway: {nat_tags.get('Name', 'N/A')}", level=2)
@@ -465,7 +1101,7 @@ def create_nat_gateway_table(document, nat_gateway, subnets_map):
     icon_cell.vertical_alignment = WD_ALIGN_VERTICAL.CENTER
     header_caract_cell = table.cell(0, 1)
     header_caract_cell.merge(table.cell(0, 2))
-    header_caract_cell.text = 'Características'
+    header_caract_cell.text = tr('Características', locale)
     header_caract_cell.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
     shading_caract = parse_xml(r'<w:shd {} w:fill="00A9ED"/>'.format(nsdecls('w')))
     header_caract_cell._tc.get_or_add_tcPr().append(shading_caract)
@@ -476,7 +1112,7 @@ def create_nat_gateway_table(document, nat_gateway, subnets_map):
     data_rows = [
         ("VPC ID", subnets_map.get(subnet_id, {}).get('values', {}).get('vpc_id', 'N/A')),
         ("Subnet", f"{subnet_id} / {subnet_name} - AZ {subnet_az}"),
-        ("Nombre NATGW", nat_tags.get('Name', 'N/A')),
+        (tr("Nombre NATGW", locale), nat_tags.get('Name', 'N/A')),
         ("NATGW ID", nat_values.get('id', 'N/A'))
     ]
     for i, (label, value) in enumerate(data_rows, start=1):
@@ -485,31 +1121,31 @@ def create_nat_gateway_table(document, nat_gateway, subnets_map):
     prevent_table_split(table)
     document.add_paragraph('\n')
 
-def create_target_group_table(document, target_group, attachments):
+def create_target_group_table(document, target_group, attachments, locale='es'):
     tg_values = target_group.get('values', {})
     tg_name = tg_values.get('name', 'N/A')
-    heading = document.add_heading(f'Grupo de Destino: {tg_name}', level=2)
+    heading = document.add_heading(f"{tr('Grupo de Destino', locale)}: {tg_name}", level=2)
     heading.paragraph_format.keep_with_next = True
     table = document.add_table(rows=6, cols=2)
     table.style = 'Table Grid'
     header_caract_cell = table.cell(0, 0)
     header_caract_cell.merge(table.cell(0, 1))
-    header_caract_cell.text = 'Características'
+    header_caract_cell.text = tr('Características', locale)
     header_caract_cell.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
     shading_caract = parse_xml(r'<w:shd {} w:fill="00A9ED"/>'.format(nsdecls('w')))
     header_caract_cell._tc.get_or_add_tcPr().append(shading_caract)
     data_rows = [
-        ("Nombre", tg_name),
-        ("Tipo de destino", tg_values.get('target_type', 'N/A').capitalize()),
-        ("Protocolo", tg_values.get('protocol', 'N/A')),
-        ("Puerto", str(tg_values.get('port', 'N/A')))
+        (tr("Nombre", locale), tg_name),
+        (tr("Tipo de destino", locale), tg_values.get('target_type', 'N/A').capitalize()),
+        (tr("Protocolo", locale), tg_values.get('protocol', 'N/A')),
+        (tr("Puerto", locale), str(tg_values.get('port', 'N/A')))
     ]
     for i, (label, value) in enumerate(data_rows, start=1):
         table.cell(i, 0).text = label
         table.cell(i, 1).text = value
     header_instances_cell = table.cell(5, 0)
     header_instances_cell.merge(table.cell(5, 1))
-    header_instances_cell.text = 'Instancias Asociadas'
+    header_instances_cell.text = tr('Instancias Asociadas', locale)
     header_instances_cell.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
     tg_arn = tg_values.get('arn')
     associated_instance_ids = attachments.get(tg_arn, [])
@@ -521,11 +1157,11 @@ def create_target_group_table(document, target_group, attachments):
     else:
         row_cells = table.add_row().cells
         row_cells[0].merge(row_cells[1])
-        row_cells[0].text = "No hay instancias asociadas"
+        row_cells[0].text = tr("No hay instancias asociadas", locale)
     prevent_table_split(table)
     document.add_paragraph('\n')
 
-def create_kms_table(document, kms_key, aliases_map):
+def create_kms_table(document, kms_key, aliases_map, locale='es'):
     kms_values = kms_key.get('values', {})
     key_id = kms_values.get('id')
     alias = aliases_map.get(key_id, 'N/A')
@@ -536,15 +1172,15 @@ def create_kms_table(document, kms_key, aliases_map):
     table.style = 'Table Grid'
     side_title_cell = table.cell(0, 0)
     side_title_cell.merge(table.cell(2, 0)) # Changed merge to 2
-    side_title_cell.text = 'Claves administradas'
+    side_title_cell.text = tr('Claves administradas', locale)
     side_title_cell.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
     side_title_cell.vertical_alignment = WD_ALIGN_VERTICAL.CENTER
     header_cells = table.rows[0].cells
     header_cells[1].text = 'Alias'
     header_cells[2].text = alias
     data_rows = [
-        ("ID de la Clave", key_id),
-        ("Descripción", kms_values.get('description', 'N/A')),
+        (tr("ID de la Clave", locale), key_id),
+        (tr("Descripción", locale), kms_values.get('description', 'N/A')),
     ]
     table.cell(1, 1).text = data_rows[0][0]
     table.cell(1, 2).text = data_rows[0][1]
@@ -556,15 +1192,328 @@ def create_kms_table(document, kms_key, aliases_map):
 
 # --- LÓGICA PRINCIPAL (Llamada por el handler) ---
 
-def generate_document_from_json(input_json_path, output_docx_path, template_path):
-    """Función que orquesta la creación del documento de Word."""
-    
+def load_infrastructure_index(input_json_path):
+    """Lee y parsea el JSON una sola vez y lo indexa para poder renderizar varias versiones del documento.
+
+    El índice contiene los recursos agrupados por tipo (ya ordenados), los mapas auxiliares y el
+    resumen para el historial; nada de lo que contiene depende de la plantilla ni del idioma.
+    """
     # Corrección: El JSON del usuario es UTF-16
     with open(input_json_path, 'r', encoding='utf-16') as f:
         data = json.load(f)
 
     root_module = data.get('values', {}).get('root_module', {})
-    
+
+    # Un único recorrido del árbol de módulos en lugar de uno por tipo de recurso
+    resources, summary = {}, {'resource_counts': {}, 'vpc_ids': [], 'account_ids': []}
+    index_module_resources(root_module, resources, summary)
+    all_subnets = resources.get('aws_subnet', [])
+    all_route_tables = resources.get('aws_route_table', [])
+    all_associations = resources.get('aws_route_table_association', [])
+    all_igws = resources.get('aws_internet_gateway', [])
+    all_nat_gws = resources.get('aws_nat_gateway', [])
+    all_tgs = resources.get('aws_lb_target_group', [])
+    all_kms_aliases = resources.get('aws_kms_alias', [])
+
+    # Corrección para evitar error si alguna lista está vacía
+    subnet_map = {s['values']['id']: s for s in all_subnets if 'values' in s and 'id' in s['values']}
+    rt_map = {rt['values']['id']: rt['values'].get('tags', {}).get('Name', rt['values']['id']) for rt in all_route_tables if 'values' in rt and 'id' in rt['values']}
+    associations_map = {assoc['values']['subnet_id']: assoc['values']['route_table_id'] for assoc in all_associations if 'values' in assoc and 'subnet_id' in assoc['values']}
+    igw_map = {igw['values']['id']: igw['values'].get('tags', {}).get('Name', igw['values']['id']) for igw in all_igws if 'values' in igw and 'id' in igw['values']}
+    nat_map = {nat['values']['id']: nat['values'].get('tags', {}).get('Name', nat['values']['id']) for nat in all_nat_gws if 'values' in nat and 'id' in nat['values']}
+    aliases_map = {alias['values']['target_key_id']: alias['values'].get('name', '').replace('alias/', '') for alias in all_kms_aliases if 'values' in alias and 'target_key_id' in alias['values']}
+
+    vpcs, vpc_route_tables = [], {}
+    for vpc in resources.get('aws_vpc', []):
+        # Asegúrate que 'values' y 'id' existen antes de usarlos
+        if 'values' not in vpc or 'id' not in vpc['values']:
+            print(f"Advertencia: VPC encontrada sin 'values' o 'id'. Saltando: {vpc}")
+            continue
+        route_tables_info = {}
+        vpc_id = vpc['values']['id']
+        default_rt_id = vpc['values'].get('main_route_table_id')
+        if default_rt_id in rt_map:
+            route_tables_info["Default"] = rt_map[default_rt_id]
+
+        # Filtro más seguro para subnet_name_map
+        subnet_name_map = {s['values']['id']: s['values'].get('tags', {}).get('Name', '').lower()
+                           for s in all_subnets
+                           if 'values' in s and 'id' in s['values'] and s['values'].get('vpc_id') == vpc_id}
+
+        for assoc in all_associations:
+            if 'values' not in assoc: continue # Asegurarse que 'values' existe
+            subnet_id = assoc['values'].get('subnet_id')
+            if subnet_id in subnet_name_map:
+                subnet_name = subnet_name_map[subnet_id]
+                rt_id = assoc['values'].get('route_table_id')
+                rt_name = rt_map.get(rt_id, "N/A")
+
+                if "public" in subnet_name and "Public" not in route_tables_info:
+                    route_tables_info["Public"] = rt_name
+                elif "private" in subnet_name and "Private" not in route_tables_info:
+                    route_tables_info["Private"] = rt_name
+                elif "rds" in subnet_name and "RDS" not in route_tables_info:
+                    route_tables_info["RDS"] = rt_name
+
+        vpcs.append(vpc)
+        vpc_route_tables[vpc_id] = route_tables_info
+
+    tg_attachments_map = {}
+    for att in resources.get('aws_lb_target_group_attachment', []):
+         # Asegúrate que 'values' y las claves necesarias existen
+        if 'values' in att and 'target_group_arn' in att['values'] and 'target_id' in att['values']:
+            tg_arn = att['values']['target_group_arn']
+            if tg_arn not in tg_attachments_map:
+                tg_attachments_map[tg_arn] = []
+            tg_attachments_map[tg_arn].append(att['values']['target_id'])
+        else:
+             print(f"Advertencia: Adjunto de TG encontrado con estructura inesperada. Saltando: {att}")
+
+    listeners_by_alb = {}
+    for listener in resources.get('aws_lb_listener', []):
+        if 'values' in listener:
+            listeners_by_alb.setdefault(listener['values'].get('load_balancer_arn'), []).append(listener)
+
+    all_subnets.sort(key=lambda s: s.get('values', {}).get('tags', {}).get('Name', ''))
+    all_route_tables.sort(key=lambda s: s.get('values', {}).get('tags', {}).get('Name', ''))
+    all_nat_gws.sort(key=lambda s: s.get('values', {}).get('tags', {}).get('Name', ''))
+    all_tgs.sort(key=lambda s: s.get('values', {}).get('name', ''))
+
+    return {
+        'resources': resources,
+        'summary': summary,
+        'subnet_map': subnet_map,
+        'rt_map': rt_map,
+        'associations_map': associations_map,
+        'igw_map': igw_map,
+        'nat_map': nat_map,
+        'aliases_map': aliases_map,
+        'vpcs': vpcs,
+        'vpc_route_tables': vpc_route_tables,
+        'tg_attachments_map': tg_attachments_map,
+        'listeners_by_alb': listeners_by_alb,
+    }
+
+def build_render_sections(index):
+    """Describe cada sección del documento a partir del índice: recursos válidos, cómo renderizarla
+    completa (tablas de detalle) y qué columnas usar en el resumen y en el anexo CSV."""
+    resources = index['resources']
+    subnet_map, rt_map, associations_map = index['subnet_map'], index['rt_map'], index['associations_map']
+    tg_attachments_map, aliases_map = index['tg_attachments_map'], index['aliases_map']
+
+    def with_values(resource_type, warning, required=()):
+        items = []
+        for resource in resources.get(resource_type, []):
+            if 'values' in resource and all(key in resource['values'] for key in required):
+                items.append(resource)
+            else:
+                print(f"Advertencia: {warning}. Saltando: {resource}")
+        return items
+
+    name_tag = lambda v: (v.get('tags') or {}).get('Name', 'N/A')
+    return {
+        'vpc': {
+            'title': 'Red Privada Virtual (VPC)',
+            'items': index['vpcs'],
+            'render_item': lambda document, vpc, locale: create_vpc_table(document, vpc, index['vpc_route_tables'][vpc['values']['id']], locale),
+            'columns': [('VPC ID', lambda v: v.get('id', 'N/A')), ('Nombre vpc', name_tag), ('CIDR IPv4', lambda v: v.get('cidr_block', 'N/A'))],
+            'empty_message': "ℹ️ No se encontraron VPCs.",
+        },
+        'subredes': {
+            'title': 'Subredes (Subnets)',
+            'items': resources.get('aws_subnet', []),
+            'render_all': lambda document, subnets, locale: create_all_subnets_table(document, subnets, associations_map, rt_map, locale),
+            'columns': [('VPC ID', lambda v: v.get('vpc_id', 'N/A')), ('Tabla de ruteo asociada', lambda v: rt_map.get(associations_map.get(v.get('id')), 'N/A')),
+                        ('Nombre subred', name_tag), ('CIDR', lambda v: v.get('cidr_block', 'N/A')), ('AZ', lambda v: v.get('availability_zone', 'N/A'))],
+            'empty_message': "ℹ️ No se encontraron Subredes.",
+        },
+        'ruteo': {
+            'title': 'Sección de Ruteo',
+            'heading': 'Sección de Ruteo',
+            'items': with_values('aws_route_table', "Tabla de ruteo encontrada sin 'values'"),
+            'render_item': lambda document, rt, locale: create_route_table_section(document, rt, index['igw_map'], index['nat_map'], locale),
+            'columns': [('Nombre Tabla', name_tag), ('VPC ID', lambda v: v.get('vpc_id', 'N/A')), ('Rutas', lambda v: len(v.get('route') or []))],
+            'empty_message': "ℹ️ No se encontraron Tablas de Ruteo.",
+        },
+        'igw': {
+            'title': 'Gateways de Internet',
+            'heading': 'Gateways de Internet',
+            'items': with_values('aws_internet_gateway', "IGW encontrado sin 'values'"),
+            'render_item': lambda document, igw, locale: create_igw_section(document, igw, locale),
+            'columns': [('Nombre IGW', name_tag), ('IGW ID', lambda v: v.get('id', 'N/A')), ('VPC ID', lambda v: v.get('vpc_id', 'N/A'))],
+            'empty_message': "ℹ️ No se encontraron Gateways de Internet.",
+        },
+        'nat': {
+            'title': 'Gateways NAT',
+            'heading': 'Gateways NAT',
+            'items': with_values('aws_nat_gateway', "NAT GW encontrado sin 'values'"),
+            'render_item': lambda document, nat_gw, locale: create_nat_gateway_table(document, nat_gw, subnet_map, locale),
+            'columns': [('Nombre NATGW', name_tag), ('NATGW ID', lambda v: v.get('id', 'N/A')), ('Subred', lambda v: v.get('subnet_id', 'N/A'))],
+            'empty_message': "ℹ️ No se encontraron NAT Gateways.",
+        },
+        'ec2': {
+            'title': 'Servidor de Cómputo (EC2)',
+            'items': with_values('aws_instance', "Instancia EC2 encontrada sin 'values'"),
+            'render_item': lambda document, instance, locale: create_ec2_table(document, instance, locale),
+            'columns': [('Instance ID', lambda v: v.get('id', 'N/A')), ('Server Name', name_tag), ('Familia', lambda v: v.get('instance_type', 'N/A')),
+                        ('Subred', lambda v: v.get('subnet_id', 'N/A')), ('IP Privada', lambda v: v.get('private_ip', 'N/A'))],
+            'empty_message': "ℹ️ No se encontraron instancias EC2.",
+        },
+        'alb': {
+            'title': 'Balanceador de Carga de Aplicación (ALB)',
+            'items': with_values('aws_lb', "ALB encontrado sin 'values' o 'arn'", required=('arn',)),
+            'render_item': lambda document, alb, locale: create_alb_table(document, alb, index['listeners_by_alb'].get(alb['values']['arn'], []), tg_attachments_map, subnet_map, locale),
+            'columns': [('Nombre', lambda v: v.get('name', 'N/A')), ('Tipo', lambda v: (v.get('load_balancer_type') or 'N/A').capitalize()),
+                        ('Esquema', lambda v: "Internal" if v.get('internal') else "Internet-facing"), ('DNS name', lambda v: v.get('dns_name', 'N/A'))],
+            'empty_message': "ℹ️ No se encontraron Balanceadores de Carga.",
+        },
+        'target_groups': {
+            'title': 'Grupos de Destino (Target Groups)',
+            'heading': 'Grupos de Destino (Target Groups)',
+            'items': with_values('aws_lb_target_group', "Target Group encontrado sin 'values'"),
+            'render_item': lambda document, tg, locale: create_target_group_table(document, tg, tg_attachments_map, locale),
+            'columns': [('Nombre', lambda v: v.get('name', 'N/A')), ('Protocolo', lambda v: v.get('protocol', 'N/A')), ('Puerto', lambda v: v.get('port', 'N/A')),
+                        ('Instancias Asociadas', lambda v: ", ".join(tg_attachments_map.get(v.get('arn'), [])))],
+            'empty_message': "ℹ️ No se encontraron Target Groups.",
+        },
+        'rds': {
+            'title': 'Base de Datos Relacional (RDS)',
+            'items': with_values('aws_db_instance', "Instancia RDS encontrada sin 'values'"),
+            'render_item': lambda document, instance, locale: create_rds_table(document, instance, locale),
+            'columns': [('DB Identifier', lambda v: v.get('identifier', 'N/A')), ('Motor', lambda v: f"{v.get('engine', 'N/A')} {v.get('engine_version', '')}"),
+                        ('Tamaño', lambda v: v.get('instance_class', 'N/A')), ('Endpoint', lambda v: v.get('endpoint', 'N/A'))],
+            'empty_message': "ℹ️ No se encontraron instancias RDS.",
+        },
+        'kms': {
+            'title': 'Servicios de Gestión de Claves (KMS)',
+            'heading': 'Servicios de Gestión de Claves (KMS)',
+            'items': with_values('aws_kms_key', "Clave KMS encontrada sin 'values'"),
+            'render_item': lambda document, kms_key, locale: create_kms_table(document, kms_key, aliases_map, locale),
+            'columns': [('Alias', lambda v: aliases_map.get(v.get('id'), 'N/A')), ('ID de la Clave', lambda v: v.get('id', 'N/A')),
+                        ('Descripción', lambda v: v.get('description', 'N/A'))],
+            'empty_message': "ℹ️ No se encontraron Claves KMS.",
+        },
+    }
+
+def estimate_section_ms(level, count, full_cost_ms):
+    """Tiempo estimado (construcción + vista previa) para renderizar `count` recursos al nivel indicado."""
+    if level == 'completo':
+        return count * full_cost_ms
+    if level == 'resumen':
+        return count * min(full_cost_ms, RENDER_SUMMARY_COST_MS)
+    return count * RENDER_APPENDIX_COST_MS
+
+def is_api_gateway_event(event):
+    """Indica si la invocación llega por API Gateway (HTTP API o REST API), que corta la petición a los ~30 s.
+
+    Las URL de función Lambda también envían requestContext con apiId, pero no tienen ese límite.
+    """
+    request_context = event.get('requestContext') or {}
+    if '.lambda-url.' in request_context.get('domainName', ''):
+        return False
+    return bool(request_context.get('apiId') and (request_context.get('routeKey') or request_context.get('stage')))
+
+def render_reserve_ms(remaining_ms):
+    """Reserva para tareas posteriores al render, proporcional al tiempo restante y con tope RENDER_RESERVE_MS."""
+    return min(RENDER_RESERVE_MS, remaining_ms * RENDER_RESERVE_FRACTION)
+
+def plan_rendering(resource_counts, remaining_ms=None, renders_per_worker=1):
+    """Elige el nivel de cada sección (completo, resumen o anexo) antes de renderizar.
+
+    Primero aplica los límites de tamaño; después, si la estimación no cabe en el tiempo restante de
+    la Lambda (menos la reserva), degrada un nivel cada vez la sección más costosa hasta que quepa.
+    El presupuesto es el mismo con el que se calcula el deadline del render, así que lo planificado
+    como completo no se corta después; la reserva proporcional lo mantiene en al menos el
+    (1 - RENDER_RESERVE_FRACTION) del tiempo restante incluso con timeouts cortos.
+    """
+    counts, costs, levels = {}, {}, {}
+    for key, resource_type, full_cost_ms in RENDER_SECTIONS:
+        counts[key] = resource_counts.get(resource_type, 0)
+        costs[key] = full_cost_ms
+        if counts[key] > RENDER_MAX_SUMMARY_ROWS:
+            levels[key] = 'anexo'
+        elif counts[key] > RENDER_MAX_FULL_ITEMS:
+            levels[key] = 'resumen'
+        else:
+            levels[key] = 'completo'
+
+    estimate = lambda key: estimate_section_ms(levels[key], counts[key], costs[key]) * renders_per_worker
+    budget_ms = None
+    if remaining_ms is not None:
+        budget_ms = remaining_ms - render_reserve_ms(remaining_ms)
+        while sum(estimate(key) for key in levels) > budget_ms:
+            degradable = [key for key in levels if levels[key] != 'anexo' and counts[key]]
+            if not degradable:
+                break
+            key = max(degradable, key=estimate)
+            levels[key] = RENDER_LEVELS[RENDER_LEVELS.index(levels[key]) + 1]
+
+    return {
+        'remaining_ms': round(remaining_ms) if remaining_ms is not None else None,
+        'budget_ms': round(budget_ms) if budget_ms is not None else None,
+        'estimated_ms': round(sum(estimate(key) for key in levels)),
+        'sections': {key: {'resources': counts[key], 'level': levels[key], 'estimated_ms': round(estimate(key))} for key in levels},
+    }
+
+def adapt_render_level(level, count, full_cost_ms, deadline):
+    """Durante el render: baja el nivel planificado si el tiempo que queda ya no alcanza para la sección."""
+    remaining_ms = (deadline - time.monotonic()) * 1000
+    for candidate in RENDER_LEVELS[RENDER_LEVELS.index(level):]:
+        if candidate == 'anexo' or estimate_section_ms(candidate, count, full_cost_ms) <= remaining_ms:
+            if candidate != level:
+                print(f"ADVERTENCIA: Poco tiempo restante ({remaining_ms:.0f} ms). Sección degradada de '{level}' a '{candidate}'.")
+            return candidate
+
+def render_section_full(document, section, locale, deadline=None):
+    """Renderiza la sección con las tablas de detalle; devuelve los recursos que no alcanzaron a renderizarse."""
+    if section.get('heading'):
+        document.add_heading(tr(section['heading'], locale), level=1)
+    if 'render_all' in section:
+        section['render_all'](document, section['items'], locale)
+        return []
+    for position, item in enumerate(section['items']):
+        if deadline is not None and time.monotonic() > deadline:
+            print(f"ADVERTENCIA: Límite de tiempo alcanzado. {len(section['items']) - position} recursos pasan al anexo CSV.")
+            return section['items'][position:]
+        section['render_item'](document, item, locale)
+    return []
+
+def render_section_summary(document, section, locale):
+    """Renderiza la sección como una única tabla resumida, con una fila por recurso."""
+    heading = document.add_heading(tr(section['title'], locale), level=1)
+    heading.paragraph_format.keep_with_next = True
+    columns = section['columns']
+    table = document.add_table(rows=1, cols=len(columns))
+    table.style = 'Table Grid'
+    for cell, (label, _) in zip(table.rows[0].cells, columns):
+        cell.text = tr(label, locale)
+        cell.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
+        shading_elm = parse_xml(r'<w:shd {} w:fill="00A9ED"/>'.format(nsdecls('w')))
+        cell._tc.get_or_add_tcPr().append(shading_elm)
+    for item in section['items']:
+        values = item.get('values', {})
+        for cell, (_, getter) in zip(table.add_row().cells, columns):
+            cell.text = str(getter(values))
+    # Sin prevent_table_split: una tabla con cientos de filas no puede mantenerse en una sola página
+    document.add_paragraph('\n')
+
+def write_section_appendix(section, items, locale, csv_path):
+    """Exporta los recursos de la sección a un CSV (UTF-8 con BOM para abrirlo directamente en Excel)."""
+    with open(csv_path, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        writer.writerow([tr(label, locale) for label, _ in section['columns']])
+        for item in items:
+            values = item.get('values', {})
+            writer.writerow([getter(values) for _, getter in section['columns']])
+    return csv_path
+
+def render_document(index, output_docx_path, template_path, packaging=DOCX_PACKAGING_DEFAULT, locale='es', plan=None, deadline=None):
+    """Crea el documento de Word a partir del índice ya construido, con la plantilla e idioma indicados.
+
+    Cada sección se renderiza al nivel del plan (por defecto completo). Con `deadline` (time.monotonic)
+    las secciones se degradan si el tiempo no alcanza, y lo que no se renderiza se exporta a CSV.
+    Devuelve el nivel final de cada sección y los anexos CSV generados.
+    """
     # --- CAMBIO IMPORTANTE: Manejo de Plantilla Opcional ---
     # CAMBIO: Usar template_path que viene como argumento (puede ser None)
     try:
@@ -578,187 +1527,124 @@ def generate_document_from_json(input_json_path, output_docx_path, template_path
         print(f"Error al cargar la plantilla desde '{template_path}': {e}. Creando documento en blanco.")
         document = Document()
     # --- FIN DEL CAMBIO ---
-    
-    document.add_heading('Memoria Técnica de Infraestructura AWS', 1)
-    document.add_paragraph('Este documento contiene un resumen detallado...')
+
+    document.add_heading(tr('Memoria Técnica de Infraestructura AWS', locale), 1)
+    document.add_paragraph(tr('Este documento contiene un resumen detallado...', locale))
     document.add_paragraph('')
 
-    all_subnets = find_resources_in_module(root_module, 'aws_subnet')
-    all_route_tables = find_resources_in_module(root_module, 'aws_route_table')
-    all_associations = find_resources_in_module(root_module, 'aws_route_table_association')
-    all_igws = find_resources_in_module(root_module, 'aws_internet_gateway')
-    all_nat_gws = find_resources_in_module(root_module, 'aws_nat_gateway')
-    all_tgs = find_resources_in_module(root_module, 'aws_lb_target_group')
-    all_kms_keys = find_resources_in_module(root_module, 'aws_kms_key')
-    all_kms_aliases = find_resources_in_module(root_module, 'aws_kms_alias')
+    report = {'sections': {}, 'appendices': {}}
+    sections = build_render_sections(index)
+    for key, _, full_cost_ms in RENDER_SECTIONS:
+        section = sections[key]
+        if not section['items']:
+            print(section['empty_message'])
+            continue
 
-    # Corrección para evitar error si alguna lista está vacía
-    subnet_map = {s['values']['id']: s for s in all_subnets if 'values' in s and 'id' in s['values']}
-    rt_map = {rt['values']['id']: rt['values'].get('tags', {}).get('Name', rt['values']['id']) for rt in all_route_tables if 'values' in rt and 'id' in rt['values']}
-    associations_map = {assoc['values']['subnet_id']: assoc['values']['route_table_id'] for assoc in all_associations if 'values' in assoc and 'subnet_id' in assoc['values']}
-    igw_map = {igw['values']['id']: igw['values'].get('tags', {}).get('Name', igw['values']['id']) for igw in all_igws if 'values' in igw and 'id' in igw['values']}
-    nat_map = {nat['values']['id']: nat['values'].get('tags', {}).get('Name', nat['values']['id']) for nat in all_nat_gws if 'values' in nat and 'id' in nat['values']}
-    aliases_map = {alias['values']['target_key_id']: alias['values'].get('name', '').replace('alias/', '') for alias in all_kms_aliases if 'values' in alias and 'target_key_id' in alias['values']}
+        level = plan['sections'][key]['level'] if plan else 'completo'
+        if deadline is not None:
+            level = adapt_render_level(level, len(section['items']), full_cost_ms, deadline)
 
+        pending = []
+        if level == 'completo':
+            pending = render_section_full(document, section, locale, deadline)
+            if pending:
+                level = 'parcial'
+        elif level == 'resumen':
+            render_section_summary(document, section, locale)
+        else:
+            pending = section['items']
+            document.add_heading(tr(section['title'], locale), level=1)
 
-    all_vpcs = find_resources_in_module(root_module, 'aws_vpc')
-    if all_vpcs:
-        for vpc in all_vpcs:
-            # Asegúrate que 'values' y 'id' existen antes de usarlos
-            if 'values' not in vpc or 'id' not in vpc['values']:
-                print(f"Advertencia: VPC encontrada sin 'values' o 'id'. Saltando: {vpc}")
-                continue
-            route_tables_info = {}
-            vpc_id = vpc['values']['id']
-            default_rt_id = vpc['values'].get('main_route_table_id')
-            if default_rt_id in rt_map:
-                route_tables_info["Default"] = rt_map[default_rt_id]
-            
-            # Filtro más seguro para subnet_name_map
-            subnet_name_map = {s['values']['id']: s['values'].get('tags', {}).get('Name', '').lower() 
-                               for s in all_subnets 
-                               if 'values' in s and 'id' in s['values'] and s['values'].get('vpc_id') == vpc_id}
-
-            for assoc in all_associations:
-                if 'values' not in assoc: continue # Asegurarse que 'values' existe
-                subnet_id = assoc['values'].get('subnet_id')
-                if subnet_id in subnet_name_map:
-                    subnet_name = subnet_name_map[subnet_id]
-                    rt_id = assoc['values'].get('route_table_id')
-                    rt_name = rt_map.get(rt_id, "N/A")
-                    
-                    if "public" in subnet_name and "Public" not in route_tables_info:
-                        route_tables_info["Public"] = rt_name
-                    elif "private" in subnet_name and "Private" not in route_tables_info:
-                        route_tables_info["Private"] = rt_name
-                    elif "rds" in subnet_name and "RDS" not in route_tables_info:
-                        route_tables_info["RDS"] = rt_name
-            
-            create_vpc_table(document, vpc, route_tables_info)
-    else: 
-        print("ℹ️ No se encontraron VPCs.")
+        if pending:
+            # El nombre citado en el documento no lleva fecha para no romper el empaquetado determinista
+            appendix_name = f"anexo_{key}.csv"
+            csv_path = f"{os.path.splitext(output_docx_path)[0]}_{appendix_name}"
+            report['appendices'][key] = write_section_appendix(section, pending, locale, csv_path)
+            document.add_paragraph(tr('{count} recursos exportados al anexo CSV "{filename}".', locale).format(count=len(pending), filename=appendix_name))
+        report['sections'][key] = level
 
-    if all_subnets:
-        all_subnets.sort(key=lambda s: s.get('values', {}).get('tags', {}).get('Name', ''))
-        create_all_subnets_table(document, all_subnets, associations_map, rt_map)
-    else:
-        print("ℹ️ No se encontraron Subredes.")
-
-    if all_route_tables:
-        document.add_heading('Sección de Ruteo', level=1)
-        all_route_tables.sort(key=lambda s: s.get('values', {}).get('tags', {}).get('Name', ''))
-        for rt in all_route_tables:
-             # Asegúrate que 'values' existe antes de llamar a la función
-            if 'values' in rt:
-                create_route_table_section(document, rt, igw_map, nat_map)
-            else:
-                 print(f"Advertencia: Tabla de ruteo encontrada sin 'values'. Saltando: {rt}")
-    else:
-        print("ℹ️ No se encontraron Tablas de Ruteo.")
+    save_docx(document, output_docx_path, packaging)
+    return report
 
-    if all_igws:
-        document.add_heading('Gateways de Internet', level=1)
-        for igw in all_igws:
-            if 'values' in igw:
-                create_igw_section(document, igw)
-            else:
-                 print(f"Advertencia: IGW encontrado sin 'values'. Saltando: {igw}")
-    else:
-        print("ℹ️ No se encontraron Gateways de Internet.")
-
-    if all_nat_gws:
-        document.add_heading('Gateways NAT', level=1)
-        all_nat_gws.sort(key=lambda s: s.get('values', {}).get('tags', {}).get('Name', ''))
-        for nat_gw in all_nat_gws:
-             if 'values' in nat_gw:
-                create_nat_gateway_table(document, nat_gw, subnet_map)
-             else:
-                  print(f"Advertencia: NAT GW encontrado sin 'values'. Saltando: {nat_gw}")
-    else:
-        print("ℹ️ No se encontraron NAT Gateways.")
+def generate_document_from_json(input_json_path, output_docx_path, template_path, packaging=DOCX_PACKAGING_DEFAULT, locale='es'):
+    """Función que orquesta la creación del documento de Word. Devuelve el resumen de recursos para el historial."""
+    index = load_infrastructure_index(input_json_path)
+    render_document(index, output_docx_path, template_path, packaging, locale)
+    return index['summary']
 
-    ec2_instances = find_resources_in_module(root_module, 'aws_instance')
-    if ec2_instances:
-        for instance in ec2_instances: 
-            if 'values' in instance:
-                create_ec2_table(document, instance)
-            else:
-                 print(f"Advertencia: Instancia EC2 encontrada sin 'values'. Saltando: {instance}")
-    else: print("ℹ️ No se encontraron instancias EC2.")
-
-    all_albs = find_resources_in_module(root_module, 'aws_lb')
-    if all_albs:
-        all_listeners = find_resources_in_module(root_module, 'aws_lb_listener')
-        all_tg_attachments = find_resources_in_module(root_module, 'aws_lb_target_group_attachment')
-        tg_attachments_map = {}
-        for att in all_tg_attachments:
-             # Asegúrate que 'values' y las claves necesarias existen
-            if 'values' in att and 'target_group_arn' in att['values'] and 'target_id' in att['values']:
-                tg_arn = att['values']['target_group_arn']
-                if tg_arn not in tg_attachments_map:
-                    tg_attachments_map[tg_arn] = []
-                tg_attachments_map[tg_arn].append(att['values']['target_id'])
-            else:
-                 print(f"Advertencia: Adjunto de TG encontrado con estructura inesperada. Saltando: {att}")
-
-
-        for alb in all_albs:
-             if 'values' in alb and 'arn' in alb['values']:
-                alb_arn = alb['values']['arn']
-                # Filtro más seguro para listeners
-                relevant_listeners = [l for l in all_listeners 
-                                      if 'values' in l and l['values'].get('load_balancer_arn') == alb_arn]
-                create_alb_table(document, alb, relevant_listeners, tg_attachments_map, subnet_map)
-             else:
-                  print(f"Advertencia: ALB encontrado sin 'values' o 'arn'. Saltando: {alb}")
-
-    else: print("ℹ️ No se encontraron Balanceadores de Carga.")
-
-    if all_tgs:
-        document.add_heading('Grupos de Destino (Target Groups)', level=1)
-        all_tgs.sort(key=lambda s: s.get('values', {}).get('name', ''))
-        # Crear tg_attachments_map aquí si no se creó antes y si es necesario
-        if 'tg_attachments_map' not in locals() and any('values' in tg for tg in all_tgs): # Solo si hay TGs con 'values'
-            all_tg_attachments = find_resources_in_module(root_module, 'aws_lb_target_group_attachment')
-            tg_attachments_map = {}
-            for att in all_tg_attachments:
-                 if 'values' in att and 'target_group_arn' in att['values'] and 'target_id' in att['values']:
-                    tg_arn = att['values']['target_group_arn']
-                    if tg_arn not in tg_attachments_map:
-                        tg_attachments_map[tg_arn] = []
-                    tg_attachments_map[tg_arn].append(att['values']['target_id'])
-                 else:
-                     print(f"Advertencia: Adjunto de TG encontrado con estructura inesperada. Saltando: {att}")
-            
-        for tg in all_tgs:
-             if 'values' in tg:
-                # Asegúrate que tg_attachments_map exista antes de pasarla
-                current_attachments = tg_attachments_map if 'tg_attachments_map' in locals() else {}
-                create_target_group_table(document, tg, current_attachments)
-             else:
-                 print(f"Advertencia: Target Group encontrado sin 'values'. Saltando: {tg}")
+# --- VERSIONES (PLANTILLA + IDIOMA) DE UN MISMO ESTADO ---
+
+def render_rendition(index, rendition, template_path, packaging, plan=None, deadline=None):
+    """Renderiza una versión y su vista previa HTML; devuelve la ruta del .docx, el HTML y el reporte del render."""
+    output_docx_path = f"/tmp/{rendition['output_filename']}"
+    report = render_document(index, output_docx_path, template_path, packaging, rendition['locale'], plan, deadline)
+    if deadline is not None and time.monotonic() > deadline:
+        # El documento ya está guardado; se prioriza entregarlo antes que la vista previa
+        print("ADVERTENCIA: Límite de tiempo alcanzado. Se omite la vista previa HTML.")
+        html_preview = f"<p>{tr('Vista previa omitida por falta de tiempo. Descargue el documento.', rendition['locale'])}</p>"
     else:
-        print("ℹ️ No se encontraron Target Groups.")
+        with open(output_docx_path, "rb") as docx_file:
+            html_preview = mammoth.convert_to_html(docx_file).value
+    return {'docx_path': output_docx_path, 'html_preview': html_preview, 'render_report': report}
 
-    rds_instances = find_resources_in_module(root_module, 'aws_db_instance')
-    if rds_instances:
-        for instance in rds_instances: 
-            if 'values' in instance:
-                create_rds_table(document, instance)
-            else:
-                 print(f"Advertencia: Instancia RDS encontrada sin 'values'. Saltando: {instance}")
+def render_rendition_worker(conn, index, rendition, template_path, packaging, plan=None, deadline=None):
+    """Punto de entrada del proceso hijo: envía ('ok', resultado) o ('error', mensaje) por la tubería."""
+    try:
+        conn.send(('ok', render_rendition(index, rendition, template_path, packaging, plan, deadline)))
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        conn.send(('error', str(e)))
+    finally:
+        conn.close()
 
-    else: print("ℹ️ No se encontraron instancias RDS.")
+def render_worker_count(renditions, parallel=True, resource_count=0):
+    """Número de procesos que se usarán para renderizar las versiones (1 = en este proceso).
 
-    if all_kms_keys:
-        document.add_heading('Servicios de Gestión de Claves (KMS)', level=1)
-        for kms_key in all_kms_keys:
-             if 'values' in kms_key:
-                create_kms_table(document, kms_key, aliases_map)
-             else:
-                  print(f"Advertencia: Clave KMS encontrada sin 'values'. Saltando: {kms_key}")
-    else:
-        print("ℹ️ No se encontraron Claves KMS.")
+    Se limita por las vCPU que corresponden a la memoria configurada de la Lambda y se desactiva con
+    estados grandes, donde varios Document simultáneos podrían agotar la memoria y matar a un hijo.
+    """
+    if not parallel or resource_count > RENDER_PARALLEL_MAX_RESOURCES:
+        return 1
+    workers = min(len(renditions), os.cpu_count() or 1)
+    memory_mb = os.environ.get('AWS_LAMBDA_FUNCTION_MEMORY_SIZE')
+    if memory_mb and memory_mb.isdigit():
+        workers = min(workers, int(memory_mb) // LAMBDA_MB_PER_VCPU)
+    return max(workers, 1)
+
+def render_renditions(index, renditions, templates, packaging, parallel=True, plan=None, deadline=None):
+    """Renderiza todas las versiones desde el mismo índice.
 
-    document.save(output_docx_path)
+    Con varios núcleos cada versión se genera en un proceso hijo (fork, el índice se hereda sin
+    volver a parsear). Se usa Process + Pipe porque Lambda no dispone de /dev/shm para Pool/Queue.
+    """
+    workers = render_worker_count(renditions, parallel, sum(index['summary']['resource_counts'].values()))
+    if workers < 2:
+        return [render_rendition(index, r, templates[r['template_key']][0], packaging, plan, deadline) for r in renditions]
 
+    print(f"Renderizando {len(renditions)} versiones en paralelo con {workers} procesos.")
+    mp_context = multiprocessing.get_context('fork')
+    results = [None] * len(renditions)
+    pending = list(enumerate(renditions))
+    while pending:
+        batch, pending = pending[:workers], pending[workers:]
+        running = []
+        for position, rendition in batch:
+            receiver, sender = mp_context.Pipe(duplex=False)
+            process = mp_context.Process(
+                target=render_rendition_worker,
+                args=(sender, index, rendition, templates[rendition['template_key']][0], packaging, plan, deadline)
+            )
+            process.start()
+            sender.close()
+            running.append((position, rendition, process, receiver))
+        for position, rendition, process, receiver in running:
+            try:
+                status, payload = receiver.recv()
+            except EOFError:
+                status, payload = 'error', f"el proceso terminó con código {process.exitcode}"
+            process.join()
+            if status != 'ok':
+                raise RuntimeError(f"Error al renderizar la versión '{rendition['label']}': {payload}")
+            results[position] = payload
+    return results